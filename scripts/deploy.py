@@ -1,10 +1,17 @@
 import argparse
+import functools
+import hashlib
 import json
+import os
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 import urllib.error
 import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 DEFAULTS = {
@@ -48,6 +55,7 @@ KEY_VAULT_SECRET_NAMES = {
     "OPENAI_API_VERSION": "openai-api-version",
     "OPENAI_DEPLOYMENT_NAME": "openai-deployment-name",
 }
+KEY_VAULT_RESOURCE = "https://vault.azure.net"
 AZ_FALLBACK_PATHS = [
     r"C:\Program Files (x86)\Microsoft SDKs\Azure\CLI2\wbin\az.cmd",
     r"C:\Program Files\Microsoft SDKs\Azure\CLI2\wbin\az.cmd",
@@ -64,54 +72,237 @@ def find_az():
 
 AZ_BIN = find_az()
 
-def run(cmd):
-    print(f"\n$ {' '.join(cmd)}")
-    subprocess.check_call(cmd)
-
-def run_capture(cmd):
-    print(f"\n$ {' '.join(cmd)}")
-    return subprocess.check_output(cmd, text=True).strip()
+def require_az():
+    if AZ_BIN is None:
+        raise FileNotFoundError("Azure CLI not found. Install Azure CLI or ensure az is on PATH.")
 
-def run_sensitive(cmd, redacted_indices):
+PLUGIN_CACHE_DIR = Path(os.environ.setdefault("TF_PLUGIN_CACHE_DIR", str(Path.home() / ".terraform.d" / "plugin-cache")))
+PLUGIN_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+os.environ.setdefault("TF_IN_AUTOMATION", "1")
+os.environ.setdefault("TF_INPUT", "0")
+
+# Roughly 3x logical cores on a typical workstation; Terraform's default is 10.
+PARALLELISM = 30
+LOCK_TIMEOUT = "120s"
+PLAN_FILE = "tfplan"
+HTTP_TIMEOUT = 60
+UMASK = os.umask(0)
+os.umask(UMASK)
+ENV_LOCK = threading.Lock()
+# The plugin cache is not safe for concurrent terraform init runs.
+INIT_LOCK = threading.Lock()
+OUTPUT_CACHE = {}
+
+def format_cmd(cmd, redacted_indices=()):
     display_cmd = cmd[:]
     for index in redacted_indices:
         if 0 <= index < len(display_cmd):
             display_cmd[index] = "***"
-    print(f"\n$ {' '.join(display_cmd)}")
-    subprocess.check_call(cmd)
+    return " ".join(display_cmd)
+
+def run(cmd, log=None, ok_codes=(0,)):
+    echo = f"\n$ {format_cmd(cmd)}"
+    if log is None:
+        print(echo)
+        returncode = subprocess.call(cmd)
+    else:
+        result = subprocess.run(cmd, text=True, capture_output=True)
+        log.append(f"{echo}\n{result.stdout or ''}{result.stderr or ''}")
+        returncode = result.returncode
+    if returncode not in ok_codes:
+        raise subprocess.CalledProcessError(returncode, cmd, output=None if log is None else "".join(log))
+    return returncode
+
+def run_capture(cmd, redacted_indices=()):
+    print(f"\n$ {format_cmd(cmd, redacted_indices)}")
+    return subprocess.check_output(cmd, text=True).strip()
+
+def lock_file_hash(tf_dir):
+    lock_path = tf_dir / ".terraform.lock.hcl"
+    if not lock_path.exists():
+        return ""
+    return hashlib.sha256(lock_path.read_bytes()).hexdigest()
+
+def is_initialized(tf_dir):
+    stamp_path = tf_dir / ".terraform" / "lock.sha256"
+    if not (tf_dir / ".terraform" / "providers").exists() or not stamp_path.exists():
+        return False
+    return stamp_path.read_text(encoding="utf-8") == lock_file_hash(tf_dir)
+
+def mark_initialized(tf_dir):
+    (tf_dir / ".terraform" / "lock.sha256").write_text(lock_file_hash(tf_dir), encoding="utf-8")
+
+def tf_init(tf_dir, log=None):
+    if is_initialized(tf_dir):
+        return
+    run(["terraform", f"-chdir={tf_dir}", "init", "-input=false"], log)
+    mark_initialized(tf_dir)
+
+def tf_apply(tf_dir, parallelism=None, plan_file=None):
+    if parallelism is None:
+        parallelism = PARALLELISM
+    cmd = [
+        "terraform",
+        f"-chdir={tf_dir}",
+        "apply",
+        "-auto-approve",
+        "-input=false",
+        f"-parallelism={parallelism}",
+        f"-lock-timeout={LOCK_TIMEOUT}",
+    ]
+    if plan_file is not None:
+        cmd.append(plan_file)
+    return cmd
+
+def tf_plan(tf_dir):
+    return [
+        "terraform",
+        f"-chdir={tf_dir}",
+        "plan",
+        "-detailed-exitcode",
+        "-input=false",
+        f"-out={PLAN_FILE}",
+        f"-parallelism={PARALLELISM}",
+        f"-lock-timeout={LOCK_TIMEOUT}",
+    ]
+
+def plan_has_changes(tf_dir, log=None):
+    return run(tf_plan(tf_dir), log, ok_codes=(0, 2)) == 2
+
+def discard_plan(tf_dir):
+    (tf_dir / PLAN_FILE).unlink(missing_ok=True)
+
+def apply(tf_dir, log=None):
+    try:
+        if not plan_has_changes(tf_dir, log):
+            return
+        run(tf_apply(tf_dir, plan_file=PLAN_FILE), log)
+    finally:
+        discard_plan(tf_dir)
+    invalidate_outputs(tf_dir)
+
+def forward_lines(stream, target, buffer):
+    for line in stream:
+        target.write(line)
+        target.flush()
+        buffer.append(line)
+
+def run_streaming(cmd):
+    print(f"\n$ {format_cmd(cmd)}")
+    stdout_tail = deque(maxlen=2000)
+    stderr_tail = deque(maxlen=2000)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1) as proc:
+        readers = [
+            threading.Thread(target=forward_lines, args=(proc.stdout, sys.stdout, stdout_tail)),
+            threading.Thread(target=forward_lines, args=(proc.stderr, sys.stderr, stderr_tail)),
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        returncode = proc.wait()
+    return returncode, "".join(stdout_tail) + "".join(stderr_tail)
 
 def run_apply_with_import(tf_dir, deployment_id):
-    cmd = ["terraform", f"-chdir={tf_dir}", "apply", "-auto-approve"]
-    print(f"\n$ {' '.join(cmd)}")
-    result = subprocess.run(cmd, text=True, capture_output=True)
-    if result.stdout:
-        print(result.stdout, end="")
-    if result.stderr:
-        print(result.stderr, end="", file=sys.stderr)
-    if result.returncode == 0:
+    try:
+        if not plan_has_changes(tf_dir):
+            return
+        cmd = tf_apply(tf_dir, plan_file=PLAN_FILE)
+        returncode, combined = run_streaming(cmd)
+    finally:
+        discard_plan(tf_dir)
+    if returncode == 0:
+        invalidate_outputs(tf_dir)
         return
-    combined = (result.stdout or "") + (result.stderr or "")
     if "already exists" in combined and "azurerm_cognitive_deployment" in combined:
         run(["terraform", f"-chdir={tf_dir}", "import", "azurerm_cognitive_deployment.main", deployment_id])
-        run(cmd)
+        apply(tf_dir)
         return
-    raise subprocess.CalledProcessError(result.returncode, cmd)
-
-def hcl_value(value):
-    if value is None:
-        return "null"
-    if isinstance(value, bool):
-        return "true" if value else "false"
-    if isinstance(value, (int, float)):
-        return str(value)
+    raise subprocess.CalledProcessError(returncode, cmd)
+
+def stage(tf_dir):
+    log = []
+    with INIT_LOCK:
+        tf_init(tf_dir, log)
+    apply(tf_dir, log)
+    return "".join(log)
+
+def run_stages(tf_dirs):
+    error = None
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(stage, tf_dir) for tf_dir in tf_dirs]
+        for future in as_completed(futures):
+            try:
+                print(future.result(), end="")
+            except subprocess.CalledProcessError as exc:
+                print(exc.output, end="")
+                error = error or exc
+    if error is not None:
+        raise error
+
+def hcl_string(value):
     escaped = str(value).replace('"', '\\"')
     return f'"{escaped}"'
 
+HCL_FORMATTERS = {
+    type(None): lambda value: "null",
+    bool: lambda value: "true" if value else "false",
+    int: str,
+    float: str,
+    str: hcl_string,
+}
+
+def hcl_value(value):
+    return HCL_FORMATTERS.get(type(value), hcl_string)(value)
+
+def atomic_write(path, contents):
+    if path.exists() and path.read_text(encoding="utf-8") == contents:
+        return
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    tmp_path = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            tmp_file.write(contents)
+        if path.exists():
+            shutil.copymode(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
 def write_tfvars(path, items):
-    lines = [f"{key} = {hcl_value(value)}" for key, value in items]
-    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    contents = "\n".join(f"{key} = {hcl_value(value)}" for key, value in items) + "\n"
+    atomic_write(path, contents)
+
+def read_state_outputs(tf_dir):
+    state_path = tf_dir / "terraform.tfstate"
+    if not state_path.exists():
+        return None
+    try:
+        return json.loads(state_path.read_text(encoding="utf-8")).get("outputs", {})
+    except (OSError, ValueError):
+        return None
+
+def get_outputs(tf_dir):
+    outputs = OUTPUT_CACHE.get(tf_dir)
+    if outputs is not None:
+        return outputs
+    raw = read_state_outputs(tf_dir)
+    if raw is None:
+        raw = json.loads(run_capture(["terraform", f"-chdir={tf_dir}", "output", "-json"]) or "{}")
+    outputs = {name: output["value"] for name, output in raw.items() if isinstance(output.get("value"), str)}
+    OUTPUT_CACHE[tf_dir] = outputs
+    return outputs
+
+def invalidate_outputs(tf_dir):
+    OUTPUT_CACHE.pop(tf_dir, None)
 
 def get_output(tf_dir, output_name):
+    outputs = get_outputs(tf_dir)
+    if output_name in outputs:
+        return outputs[output_name]
     return run_capture(["terraform", f"-chdir={tf_dir}", "output", "-raw", output_name])
 
 def get_output_optional(tf_dir, output_name):
@@ -124,7 +315,7 @@ def get_output_with_apply(tf_dir, output_name):
     try:
         return get_output(tf_dir, output_name)
     except subprocess.CalledProcessError:
-        run(["terraform", f"-chdir={tf_dir}", "apply", "-auto-approve"])
+        apply(tf_dir)
         return get_output(tf_dir, output_name)
 
 def write_rg_tfvars(rg_dir):
@@ -191,9 +382,8 @@ def write_notebooks_tfvars(notebooks_dir, rg_name):
     write_tfvars(notebooks_dir / "terraform.tfvars", items)
 
 def write_serving_tfvars(serving_dir, rg_name, databricks_dir):
-    if AZ_BIN is None:
-        raise FileNotFoundError("Azure CLI not found. Install Azure CLI or ensure az is on PATH.")
-    run(["terraform", f"-chdir={databricks_dir}", "init"])
+    if not (databricks_dir / "terraform.tfstate").exists():
+        tf_init(databricks_dir)
     workspace_url = get_output(databricks_dir, "databricks_workspace_url")
     model_version = DEFAULTS["serving_model_version"]
     if model_version is None:
@@ -225,17 +415,13 @@ def normalize_workspace_url(url):
     return f"https://{url}"
 
 def read_env_file(path):
-    values = {}
     if not path.exists():
-        return values
-    for line in path.read_text(encoding="utf-8").splitlines():
-        if not line or line.startswith("#"):
-            continue
-        if "=" not in line:
-            continue
-        key, value = line.split("=", 1)
-        values[key] = value
-    return values
+        return {}
+    return dict(
+        line.split("=", 1)
+        for line in path.read_text(encoding="utf-8").splitlines()
+        if line and not line.startswith("#") and "=" in line
+    )
 
 def write_env_file(
     repo_root,
@@ -246,29 +432,26 @@ def write_env_file(
     workspace_url=None,
 ):
     env_path = repo_root / ".env"
-    values = read_env_file(env_path)
-    if openai_endpoint is not None:
-        values["OPENAI_API_BASE"] = openai_endpoint
-    if openai_key is not None:
-        values["OPENAI_API_KEY"] = openai_key
-    if api_version is not None:
-        values["OPENAI_API_VERSION"] = api_version
-    if deployment_name is not None:
-        values["OPENAI_DEPLOYMENT_NAME"] = deployment_name
-    if workspace_url is not None:
-        values["DATABRICKS_WORKSPACE_URL"] = normalize_workspace_url(workspace_url)
-    if not values:
-        return
-    lines = [f"{key}={values[key]}" for key in ENV_KEYS if key in values]
-    for key in sorted(values):
-        if key in ENV_KEYS:
-            continue
-        lines.append(f"{key}={values[key]}")
-    env_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    with ENV_LOCK:
+        existing = read_env_file(env_path)
+        values = dict(existing)
+        if openai_endpoint is not None:
+            values["OPENAI_API_BASE"] = openai_endpoint
+        if openai_key is not None:
+            values["OPENAI_API_KEY"] = openai_key
+        if api_version is not None:
+            values["OPENAI_API_VERSION"] = api_version
+        if deployment_name is not None:
+            values["OPENAI_DEPLOYMENT_NAME"] = deployment_name
+        if workspace_url is not None:
+            values["DATABRICKS_WORKSPACE_URL"] = normalize_workspace_url(workspace_url)
+        if not values or values == existing:
+            return
+        ordered = {key: values[key] for key in ENV_KEYS if key in values}
+        ordered.update({key: value for key, value in sorted(values.items()) if key not in ENV_KEYS})
+        atomic_write(env_path, "\n".join(f"{key}={value}" for key, value in ordered.items()) + "\n")
 
 def set_databricks_kv_policy(vault_name):
-    if AZ_BIN is None:
-        raise FileNotFoundError("Azure CLI not found. Install Azure CLI or ensure az is on PATH.")
     run(
         [
             AZ_BIN,
@@ -284,45 +467,57 @@ def set_databricks_kv_policy(vault_name):
         ]
     )
 
-def set_key_vault_secret(vault_name, secret_name, secret_value):
-    if secret_value is None:
-        return
-    if AZ_BIN is None:
-        raise FileNotFoundError("Azure CLI not found. Install Azure CLI or ensure az is on PATH.")
-    cmd = [
-        AZ_BIN,
-        "keyvault",
-        "secret",
-        "set",
-        "--vault-name",
-        vault_name,
-        "--name",
-        secret_name,
-        "--value",
-        secret_value,
-    ]
-    run_sensitive(cmd, redacted_indices=[len(cmd) - 1])
+def api_request(url, token, method, payload=None, service="Databricks"):
+    data = None
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(url, data=data, method=method)
+    req.add_header("Authorization", f"Bearer {token}")
+    req.add_header("Content-Type", "application/json")
+    try:
+        with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT) as resp:
+            body = resp.read().decode("utf-8")
+    except urllib.error.HTTPError as exc:
+        detail = exc.read().decode("utf-8")
+        raise RuntimeError(f"{service} API error {exc.code}: {detail}") from exc
+    except (urllib.error.URLError, TimeoutError) as exc:
+        raise RuntimeError(f"{service} request failed: {exc}") from exc
+    return json.loads(body) if body else None
+
+def kv_secret_url(vault_name, secret_name):
+    return f"https://{vault_name}.vault.azure.net/secrets/{secret_name}?api-version=7.4"
+
+def kv_put(vault_name, token, secret_name, secret_value):
+    api_request(kv_secret_url(vault_name, secret_name), token, "PUT", {"value": secret_value}, service="Key Vault")
 
 def sync_key_vault_secrets(vault_name, endpoint, api_key, api_version, deployment_name):
-    set_key_vault_secret(vault_name, KEY_VAULT_SECRET_NAMES["OPENAI_API_BASE"], endpoint)
-    set_key_vault_secret(vault_name, KEY_VAULT_SECRET_NAMES["OPENAI_API_KEY"], api_key)
-    set_key_vault_secret(vault_name, KEY_VAULT_SECRET_NAMES["OPENAI_API_VERSION"], api_version)
-    set_key_vault_secret(
-        vault_name,
-        KEY_VAULT_SECRET_NAMES["OPENAI_DEPLOYMENT_NAME"],
-        deployment_name,
-    )
+    values = {
+        KEY_VAULT_SECRET_NAMES["OPENAI_API_BASE"]: endpoint,
+        KEY_VAULT_SECRET_NAMES["OPENAI_API_KEY"]: api_key,
+        KEY_VAULT_SECRET_NAMES["OPENAI_API_VERSION"]: api_version,
+        KEY_VAULT_SECRET_NAMES["OPENAI_DEPLOYMENT_NAME"]: deployment_name,
+    }
+    secrets = [(secret_name, secret_value) for secret_name, secret_value in values.items() if secret_value is not None]
+    token = get_access_token(KEY_VAULT_RESOURCE)
+    for secret_name, _ in secrets:
+        print(f"\n$ PUT {kv_secret_url(vault_name, secret_name)} value=***")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(kv_put, vault_name, token, secret_name, secret_value)
+            for secret_name, secret_value in secrets
+        ]
+        for future in futures:
+            future.result()
 
-def get_databricks_aad_token():
-    if AZ_BIN is None:
-        raise FileNotFoundError("Azure CLI not found. Install Azure CLI or ensure az is on PATH.")
+@functools.lru_cache(maxsize=8)
+def get_access_token(resource):
     return run_capture(
         [
             AZ_BIN,
             "account",
             "get-access-token",
             "--resource",
-            DATABRICKS_SP_APP_ID,
+            resource,
             "--query",
             "accessToken",
             "-o",
@@ -330,6 +525,9 @@ def get_databricks_aad_token():
         ]
     )
 
+def get_databricks_aad_token():
+    return get_access_token(DATABRICKS_SP_APP_ID)
+
 def normalize_databricks_host(host):
     if not host:
         return host
@@ -337,18 +535,7 @@ def normalize_databricks_host(host):
 
 def databricks_api(host, token, method, path, payload=None):
     url = f"{normalize_databricks_host(host).rstrip('/')}{path}"
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(url, data=data, method=method)
-    req.add_header("Authorization", f"Bearer {token}")
-    req.add_header("Content-Type", "application/json")
-    try:
-        with urllib.request.urlopen(req) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8")
-        raise RuntimeError(f"Databricks API error {exc.code}: {detail}") from exc
+    return api_request(url, token, method, payload)
 
 def get_latest_model_version(host, token, model_name):
     paths = [
@@ -356,30 +543,21 @@ def get_latest_model_version(host, token, model_name):
         ("/api/2.0/mlflow/model-versions/search", {"filter": f"name='{model_name}'"}),
         ("/api/2.0/preview/mlflow/model-versions/search", {"filter": f"name='{model_name}'"}),
     ]
-    versions = []
-    last_error = None
     for path, payload in paths:
         try:
             response = databricks_api(host, token, "POST", path, payload)
         except RuntimeError as exc:
-            last_error = exc
             if "ENDPOINT_NOT_FOUND" in str(exc):
                 continue
             raise
-        items = response.get("model_versions", [])
-        for item in items:
-            version = item.get("version")
-            if version is not None:
-                try:
-                    versions.append(int(version))
-                except ValueError:
-                    continue
+        versions = []
+        for item in response.get("model_versions", []):
+            try:
+                versions.append(int(item["version"]))
+            except (KeyError, TypeError, ValueError):
+                continue
         if versions:
             return str(max(versions))
-    if last_error is not None and "ENDPOINT_NOT_FOUND" in str(last_error):
-        return None
-    if last_error is not None:
-        raise last_error
     return None
 
 if __name__ == "__main__":
@@ -394,7 +572,28 @@ if __name__ == "__main__":
         group.add_argument("--compute-only", action="store_true", help="Deploy only the Databricks compute stack")
         group.add_argument("--notebooks-only", action="store_true", help="Deploy only the notebooks stack")
         group.add_argument("--serving-only", action="store_true", help="Deploy only the serving endpoint stack")
+        parser.add_argument(
+            "--tf-parallelism",
+            type=int,
+            default=PARALLELISM,
+            help=f"Number of concurrent operations for terraform plan and apply (default: {PARALLELISM})",
+        )
         args = parser.parse_args()
+        if args.tf_parallelism < 1:
+            parser.error("--tf-parallelism must be at least 1")
+        PARALLELISM = args.tf_parallelism
+        stack_only = (
+            args.rg_only
+            or args.openai_only
+            or args.deployment_only
+            or args.databricks_only
+            or args.keyvault_only
+            or args.compute_only
+            or args.notebooks_only
+            or args.serving_only
+        )
+        if args.keyvault_only or args.serving_only or not stack_only:
+            require_az()
 
         repo_root = Path(__file__).resolve().parent.parent
         rg_dir = repo_root / "terraform" / "01_resource_group"
@@ -408,16 +607,16 @@ if __name__ == "__main__":
 
         if args.rg_only:
             write_rg_tfvars(rg_dir)
-            run(["terraform", f"-chdir={rg_dir}", "init"])
-            run(["terraform", f"-chdir={rg_dir}", "apply", "-auto-approve"])
+            tf_init(rg_dir)
+            apply(rg_dir)
             sys.exit(0)
 
         if args.openai_only:
-            run(["terraform", f"-chdir={rg_dir}", "init"])
+            tf_init(rg_dir)
             rg_name = get_output(rg_dir, "resource_group_name")
             write_openai_tfvars(openai_dir, rg_name)
-            run(["terraform", f"-chdir={openai_dir}", "init"])
-            run(["terraform", f"-chdir={openai_dir}", "apply", "-auto-approve"])
+            tf_init(openai_dir)
+            apply(openai_dir)
             endpoint = get_output(openai_dir, "openai_endpoint")
             api_key = get_output_with_apply(openai_dir, "openai_primary_key")
             write_env_file(
@@ -430,15 +629,15 @@ if __name__ == "__main__":
             sys.exit(0)
 
         if args.deployment_only:
-            run(["terraform", f"-chdir={rg_dir}", "init"])
+            tf_init(rg_dir)
             rg_name = get_output(rg_dir, "resource_group_name")
-            run(["terraform", f"-chdir={openai_dir}", "init"])
+            tf_init(openai_dir)
             account_name = get_output(openai_dir, "openai_account_name")
             account_id = get_output(openai_dir, "openai_account_id")
             endpoint = get_output(openai_dir, "openai_endpoint")
             api_key = get_output_with_apply(openai_dir, "openai_primary_key")
             write_deployment_tfvars(deployment_dir, rg_name, account_name)
-            run(["terraform", f"-chdir={deployment_dir}", "init"])
+            tf_init(deployment_dir)
             deployment_id = f"{account_id}/deployments/{DEFAULTS['deployment_name']}"
             run_apply_with_import(deployment_dir, deployment_id)
             write_env_file(
@@ -451,21 +650,21 @@ if __name__ == "__main__":
             sys.exit(0)
 
         if args.databricks_only:
-            run(["terraform", f"-chdir={rg_dir}", "init"])
+            tf_init(rg_dir)
             rg_name = get_output(rg_dir, "resource_group_name")
             write_databricks_tfvars(databricks_dir, rg_name)
-            run(["terraform", f"-chdir={databricks_dir}", "init"])
-            run(["terraform", f"-chdir={databricks_dir}", "apply", "-auto-approve"])
+            tf_init(databricks_dir)
+            apply(databricks_dir)
             workspace_url = get_output(databricks_dir, "databricks_workspace_url")
             write_env_file(repo_root, workspace_url=workspace_url)
             sys.exit(0)
 
         if args.keyvault_only:
-            run(["terraform", f"-chdir={rg_dir}", "init"])
+            tf_init(rg_dir)
             rg_name = get_output(rg_dir, "resource_group_name")
             write_key_vault_tfvars(key_vault_dir, rg_name)
-            run(["terraform", f"-chdir={key_vault_dir}", "init"])
-            run(["terraform", f"-chdir={key_vault_dir}", "apply", "-auto-approve"])
+            tf_init(key_vault_dir)
+            apply(key_vault_dir)
             vault_name = get_output(key_vault_dir, "key_vault_name")
             set_databricks_kv_policy(vault_name)
             endpoint = get_output_optional(openai_dir, "openai_endpoint")
@@ -481,55 +680,52 @@ if __name__ == "__main__":
             sys.exit(0)
 
         if args.compute_only:
-            run(["terraform", f"-chdir={rg_dir}", "init"])
+            tf_init(rg_dir)
             rg_name = get_output(rg_dir, "resource_group_name")
             write_databricks_compute_tfvars(compute_dir, rg_name)
-            run(["terraform", f"-chdir={compute_dir}", "init"])
-            run(["terraform", f"-chdir={compute_dir}", "apply", "-auto-approve"])
+            tf_init(compute_dir)
+            apply(compute_dir)
             sys.exit(0)
 
         if args.notebooks_only:
-            run(["terraform", f"-chdir={rg_dir}", "init"])
+            tf_init(rg_dir)
             rg_name = get_output(rg_dir, "resource_group_name")
             write_notebooks_tfvars(notebooks_dir, rg_name)
-            run(["terraform", f"-chdir={notebooks_dir}", "init"])
-            run(["terraform", f"-chdir={notebooks_dir}", "apply", "-auto-approve"])
+            tf_init(notebooks_dir)
+            apply(notebooks_dir)
             sys.exit(0)
 
         if args.serving_only:
-            run(["terraform", f"-chdir={rg_dir}", "init"])
+            tf_init(rg_dir)
             rg_name = get_output(rg_dir, "resource_group_name")
             write_serving_tfvars(serving_dir, rg_name, databricks_dir)
-            run(["terraform", f"-chdir={serving_dir}", "init"])
-            run(["terraform", f"-chdir={serving_dir}", "apply", "-auto-approve"])
+            tf_init(serving_dir)
+            apply(serving_dir)
             sys.exit(0)
 
         write_rg_tfvars(rg_dir)
-        run(["terraform", f"-chdir={rg_dir}", "init"])
-        run(["terraform", f"-chdir={rg_dir}", "apply", "-auto-approve"])
+        tf_init(rg_dir)
+        apply(rg_dir)
         rg_name = get_output(rg_dir, "resource_group_name")
-
         write_openai_tfvars(openai_dir, rg_name)
-        run(["terraform", f"-chdir={openai_dir}", "init"])
-        run(["terraform", f"-chdir={openai_dir}", "apply", "-auto-approve"])
+        write_databricks_tfvars(databricks_dir, rg_name)
+        write_key_vault_tfvars(key_vault_dir, rg_name)
+        write_databricks_compute_tfvars(compute_dir, rg_name)
+        write_notebooks_tfvars(notebooks_dir, rg_name)
+
+        run_stages([openai_dir, databricks_dir, key_vault_dir])
+
         account_name = get_output(openai_dir, "openai_account_name")
         account_id = get_output(openai_dir, "openai_account_id")
         endpoint = get_output(openai_dir, "openai_endpoint")
         api_key = get_output_with_apply(openai_dir, "openai_primary_key")
 
         write_deployment_tfvars(deployment_dir, rg_name, account_name)
-        run(["terraform", f"-chdir={deployment_dir}", "init"])
+        tf_init(deployment_dir)
         deployment_id = f"{account_id}/deployments/{DEFAULTS['deployment_name']}"
         run_apply_with_import(deployment_dir, deployment_id)
 
-        write_databricks_tfvars(databricks_dir, rg_name)
-        run(["terraform", f"-chdir={databricks_dir}", "init"])
-        run(["terraform", f"-chdir={databricks_dir}", "apply", "-auto-approve"])
         workspace_url = get_output(databricks_dir, "databricks_workspace_url")
-
-        write_key_vault_tfvars(key_vault_dir, rg_name)
-        run(["terraform", f"-chdir={key_vault_dir}", "init"])
-        run(["terraform", f"-chdir={key_vault_dir}", "apply", "-auto-approve"])
         vault_name = get_output(key_vault_dir, "key_vault_name")
         set_databricks_kv_policy(vault_name)
         sync_key_vault_secrets(
@@ -540,13 +736,11 @@ if __name__ == "__main__":
             DEFAULTS["deployment_name"],
         )
 
-        write_databricks_compute_tfvars(compute_dir, rg_name)
-        run(["terraform", f"-chdir={compute_dir}", "init"])
-        run(["terraform", f"-chdir={compute_dir}", "apply", "-auto-approve"])
+        tf_init(compute_dir)
+        apply(compute_dir)
 
-        write_notebooks_tfvars(notebooks_dir, rg_name)
-        run(["terraform", f"-chdir={notebooks_dir}", "init"])
-        run(["terraform", f"-chdir={notebooks_dir}", "apply", "-auto-approve"])
+        tf_init(notebooks_dir)
+        apply(notebooks_dir)
         write_env_file(
             repo_root,
             openai_endpoint=endpoint,
@@ -558,3 +752,6 @@ if __name__ == "__main__":
     except subprocess.CalledProcessError as exc:
         print(f"Command failed: {exc}")
         sys.exit(exc.returncode)
+    except RuntimeError as exc:
+        print(f"Request failed: {exc}")
+        sys.exit(1)